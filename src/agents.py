@@ -1,7 +1,24 @@
+import asyncio
+import functools
+import os
+import re
 from crewai import Agent, Task, Crew, Process, LLM
 from crewai.tools import BaseTool
-from rag import query_rag
+from rag import query_rag, embed_query
 from leads_manager import save_lead
+from semantic_cache import SemanticCache
+
+# Configuration
+# Agents talk to a vLLM OpenAI-compatible server (see README), routed through LiteLLM.
+# The server runs an AWQ checkpoint, exposed under this model name with --served-model-name.
+LLM_MODEL = "openai/meta-llama/Llama-3.1-8B-Instruct"
+LLM_BASE_URL = "http://localhost:8000/v1"
+LLM_API_KEY = "EMPTY"
+# The Salesman and the Clerk only do narrow, scripted work: a small model on its own vLLM server is enough
+LIGHT_LLM_MODEL = "openai/Qwen/Qwen2.5-1.5B-Instruct-AWQ"
+LIGHT_LLM_BASE_URL = "http://localhost:8001/v1"
+# Agent thoughts and tool calls are only logged when CREWAI_VERBOSE=1
+VERBOSE = os.getenv("CREWAI_VERBOSE", "0") == "1"
 
 # 1. Define the RAG Tool
 class ESILVInfoTool(BaseTool):
@@ -11,6 +28,18 @@ class ESILVInfoTool(BaseTool):
     def _run(self, query: str) -> str:
         return query_rag(query)
 
+# CrewAI agents write their reasoning before this marker and the answer after it
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+# Values the LLM tends to hallucinate instead of real contact details
+HALLUCINATION_INDICATORS = [
+    "john doe", "jane doe", "your name", "your email", 
+    "placeholder", "example.com", "fake@email.com", "test@test.com"
+]
+PLACEHOLDER_RE = re.compile("|".join(map(re.escape, HALLUCINATION_INDICATORS)))
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+GENERIC_PLACEHOLDERS = frozenset(["name", "email", "user", "none", "unknown", "fake", "test"])
+
 class SaveLeadTool(BaseTool):
     name: str = "Save Lead Contact Info"
     description: str = "Useful for saving user contact details when they provide them. Requires 'name' and 'email'. 'topic' is optional."
@@ -20,23 +49,17 @@ class SaveLeadTool(BaseTool):
         lower_name = name.lower()
         lower_email = email.lower()
         
-        hallucination_indicators = [
-            "john doe", "jane doe", "your name", "your email", 
-            "placeholder", "example.com", "fake@email.com", "test@test.com"
-        ]
-        
         # Check for common placeholders
-        if any(indicator in lower_name for indicator in hallucination_indicators):
+        if PLACEHOLDER_RE.search(lower_name):
              return f"Error: Invalid name '{name}'. It looks like a placeholder. Please ask the user for their real name."
              
-        if any(indicator in lower_email for indicator in hallucination_indicators):
+        if PLACEHOLDER_RE.search(lower_email):
              return f"Error: Invalid email '{email}'. It looks like a placeholder. Please ask the user for their real email."
              
         # Check for generic single-word placeholders if they match exactly
-        generic_placeholders = ["name", "email", "user", "none", "unknown", "fake", "test"]
-        if lower_name in generic_placeholders:
+        if lower_name in GENERIC_PLACEHOLDERS:
              return f"Error: Invalid name '{name}'. Please provide a real name."
-        if lower_email in generic_placeholders:
+        if lower_email in GENERIC_PLACEHOLDERS:
              return f"Error: Invalid email '{email}'. Please provide a real email."
              
         if "@" not in email or "." not in email:
@@ -50,10 +73,24 @@ class SaveLeadTool(BaseTool):
 rag_tool = ESILVInfoTool()
 save_lead_tool = SaveLeadTool()
 
+# Final answers of previous turns, reused for near-duplicate questions.
+# Shared by all sessions: messages with contact details (an email) are never looked up or stored.
+response_cache = SemanticCache(threshold=0.95, max_entries=512)
+
+def clear_response_cache():
+    """Drops cached answers, e.g. after the knowledge base changed."""
+    response_cache.clear()
+
 # 2. Define Agents
-def create_agents():
+# LLM clients are built once per process and shared. Agents are built per crew:
+# a running crew stores its executor state on its agents, so they can't be shared between sessions.
+@functools.lru_cache(maxsize=None)
+def get_llm(model, base_url):
+    return LLM(model=model, base_url=base_url, api_key=LLM_API_KEY)
+
+def create_info_agent():
     # Agent 1: Information Specialist
-    info_agent = Agent(
+    return Agent(
         role='ESILV Information Specialist',
         goal='Provide accurate information about ESILV programs, admissions, and student life.',
         backstory="""You are an expert on ESILV (École Supérieure d'Ingénieurs Léonard de Vinci). 
@@ -64,14 +101,15 @@ def create_agents():
         2. STRICTLY BASE YOUR ANSWERS ON THE KNOWLEDGE BASE. 
         3. If the information is not found in the knowledge base, honestly state that you don't know but suggest they visit the website.
         4. DO NOT make up information (Hallucination is strictly forbidden).""",
-        verbose=True,
+        verbose=VERBOSE,
         allow_delegation=False,
         tools=[rag_tool],
-        llm=LLM(model="ollama/llama3.1:8b", base_url="http://localhost:11434")
+        llm=get_llm(LLM_MODEL, LLM_BASE_URL)
     )
 
+def create_sales_agent():
     # Agent 2: The Salesman
-    sales_agent = Agent(
+    return Agent(
         role='The Salesman',
         goal='Analyze the user sentiment and if interested, politely offer a follow-up.',
         backstory="""You are the friendly front-desk representative at ESILV.
@@ -83,14 +121,15 @@ def create_agents():
         3. If the user seems interested in applying, programs, or specific details, you add a polite closing asking if they want an advisor to contact them.
         4. Use the EXACT phrase: "Would you like me to have an advisor contact you? Just leave your name and email." if they are interested.
         5. If the user is NOT interested, or the Info Agent said "I don't know", you do NOT add the phrase. You just pass the Info Agent's answer through.""",
-        verbose=True,
+        verbose=VERBOSE,
         allow_delegation=False,
         tools=[], # No tools, just text processing
-        llm=LLM(model="ollama/llama3.1:8b", base_url="http://localhost:11434")
+        llm=get_llm(LIGHT_LLM_MODEL, LIGHT_LLM_BASE_URL)
     )
 
+def create_clerk_agent():
     # Agent 3: The Clerk (Silent Background Process)
-    clerk_agent = Agent(
+    return Agent(
         role='The Clerk',
         goal='Silently extract and save contact information if provided.',
         backstory="""You are a silent data entry clerk.
@@ -102,31 +141,47 @@ def create_agents():
         3. You ignore placeholders like "John Doe" or "example.com".
         4. If no contact info is present, you do nothing and return "No lead found".
         5. You are invisible to the user.""",
-        verbose=True,
+        verbose=VERBOSE,
         allow_delegation=False,
         tools=[save_lead_tool],
-        llm=LLM(model="ollama/llama3.1:8b", base_url="http://localhost:11434")
+        llm=get_llm(LIGHT_LLM_MODEL, LIGHT_LLM_BASE_URL)
     )
 
-    return info_agent, sales_agent, clerk_agent
-
 # 3. Define Tasks & Crew
-def create_crew(user_question):
-    info_agent, sales_agent, _ = create_agents()
+# Task descriptions keep their fixed instructions first and the per-request values last,
+# so vLLM's prefix cache can reuse the KV cache of the shared prompt prefix.
+def create_info_crew(user_question):
+    info_agent = create_info_agent()
 
     # Task 1: Answer the question
     answer_task = Task(
-        description=f"""Analyze the user's question: '{user_question}'.
+        description=f"""Analyze the user's question given below.
         Use the 'ESILV Knowledge Base' tool to find relevant information.
         Synthesize the retrieved information into a clear and helpful response.
-        If the information is not found in the knowledge base, honestly state that you don't know.""",
+        If the information is not found in the knowledge base, honestly state that you don't know.
+
+        User Question: '{user_question}'""",
         expected_output="A helpful and accurate answer to the user's question based on the retrieved context.",
         agent=info_agent
     )
-    
+
+    crew = Crew(
+        agents=[info_agent],
+        tasks=[answer_task],
+        verbose=VERBOSE,
+        process=Process.sequential,
+        cache=True # Reuse identical knowledge base lookups within the turn
+    )
+
+    return crew
+
+def create_sales_crew(user_question, info_answer, stream=False):
+    sales_agent = create_sales_agent()
+
     # Task 2: Sales Polish (Append Call to Action)
+    # The Info Agent's answer is passed in directly so this crew can run alongside the lead capture crew.
     sales_task = Task(
-        description=f"""Review the User's Question ('{user_question}') and the Answer provided by the Info Agent.
+        description=f"""Review the User's Question and the Answer provided by the Info Agent, both given below.
         
         1. If the Info Agent's answer indicates they found relevant information AND the user seems interested (e.g., asking about programs, prices, admissions, campus life):
            - Append the following text to the answer: "\n\nWould you like me to have an advisor contact you? Just leave your name and email."
@@ -134,29 +189,30 @@ def create_crew(user_question):
         2. If the Info Agent said "I don't know" or the topic is negative/unrelated:
            - Do NOT append anything. Return the Info Agent's answer exactly as is.
            
-        3. Ensure the final output is a cohesive response.""",
+        3. Ensure the final output is a cohesive response.
+
+        Info Agent's Answer: "{info_answer}"
+        User Question: '{user_question}'""",
         expected_output="The final text to be shown to the user.",
-        context=[answer_task], # Pass the output of answer_task to this task
         agent=sales_agent
     )
 
     crew = Crew(
-        agents=[info_agent, sales_agent],
-        tasks=[answer_task, sales_task],
-        verbose=True,
-        process=Process.sequential
+        agents=[sales_agent],
+        tasks=[sales_task],
+        verbose=VERBOSE,
+        process=Process.sequential,
+        cache=True,
+        stream=stream
     )
 
     return crew
 
 def create_lead_capture_crew(user_question, agent_answer):
-    _, _, clerk_agent = create_agents()
+    clerk_agent = create_clerk_agent()
 
     lead_task = Task(
         description=f"""Analyze the interaction below to determine if the user has voluntarily provided their Name and Email address.
-
-        User Question: "{user_question}"
-        Agent Answer: "{agent_answer}"
         
         INSTRUCTIONS:
         1. Look for EXPLICIT contact details (Name AND Email) in the User Question.
@@ -167,6 +223,9 @@ def create_lead_capture_crew(user_question, agent_answer):
         CRITICAL: 
         - IGNORE "John Doe", "Jane Doe", "example.com" or other placeholders.
         - Only save if it looks like a REAL user provided their details.
+
+        Agent Answer: "{agent_answer}"
+        User Question: "{user_question}"
         """,
         expected_output="Status message indicating if a lead was saved or not.",
         agent=clerk_agent
@@ -175,7 +234,7 @@ def create_lead_capture_crew(user_question, agent_answer):
     crew = Crew(
         agents=[clerk_agent],
         tasks=[lead_task],
-        verbose=True,
+        verbose=VERBOSE,
         process=Process.sequential,
         max_rpm=10,
         cache=False
@@ -183,17 +242,61 @@ def create_lead_capture_crew(user_question, agent_answer):
     
     return crew
 
-def run_crew(question):
-    # Phase 1: Get Information & Sales Pitch
-    main_crew = create_crew(question)
-    final_answer = main_crew.kickoff()
-    
-    # Phase 2: Check for leads (Silent / Background)
-    # We pass the answer too, just in case context is needed, though usually lead is in the question
+async def _capture_lead(question, agent_answer):
+    # A lead needs an email: skip the Clerk's LLM call when the question has none
+    if not EMAIL_RE.search(question):
+        return
+
+    # Silent / Background: failures must never reach the user
     try:
-        lead_crew = create_lead_capture_crew(question, str(final_answer))
-        lead_crew.kickoff()
+        lead_crew = create_lead_capture_crew(question, agent_answer)
+        await lead_crew.kickoff_async()
     except Exception as e:
         print(f"Lead capture background process failed (non-critical): {e}")
 
-    return str(final_answer)
+def _is_cacheable(question):
+    return EMAIL_RE.search(question) is None
+
+async def run_crew_stream(question):
+    """
+    Answers `question`, yielding the final answer piece by piece while the Salesman generates it.
+    """
+    # Phase 0: Near-duplicate questions are answered from the cache, skipping the agents.
+    cacheable = _is_cacheable(question)
+    if cacheable:
+        # Model forward pass (and model load on first use): keep it off the event loop shared by all sessions
+        question_embedding = await asyncio.to_thread(embed_query, question)
+        cached_answer = response_cache.lookup(question_embedding)
+        if cached_answer is not None:
+            yield cached_answer
+            return
+
+    # Phase 1: Get Information
+    info_crew = create_info_crew(question)
+    info_answer = str(await info_crew.kickoff_async())
+
+    # Phase 2: Sales Pitch and lead check both only post-process the question and the answer,
+    # so they run concurrently. The Clerk stays non-streaming: its output is never shown
+    lead_capture = asyncio.create_task(_capture_lead(question, info_answer))
+    sales_crew = create_sales_crew(question, info_answer, stream=True)
+    streaming = await sales_crew.kickoff_async()
+
+    # The raw LLM output starts with the agent's reasoning: only what follows "Final Answer:" is shown
+    raw_output = ""
+    shown = 0
+    async for chunk in streaming:
+        raw_output += chunk.content
+        if FINAL_ANSWER_MARKER not in raw_output:
+            continue
+        visible = raw_output.split(FINAL_ANSWER_MARKER, 1)[1].lstrip()
+        if len(visible) > shown:
+            yield visible[shown:]
+            shown = len(visible)
+
+    final_answer = str(streaming.result)
+    if not shown:
+        yield final_answer
+
+    if cacheable:
+        response_cache.add(question_embedding, final_answer)
+    await lead_capture
@@ -1,17 +1,47 @@
 import streamlit as st
+import logging
 import os
 import time
 import asyncio
 import sys
+import threading
 from rag import load_documents, split_documents, add_to_chroma, clear_database
-from agents import run_crew
-from crawler import crawl_esilv
+from agents import run_crew_stream, clear_response_cache, LLM_BASE_URL, LIGHT_LLM_BASE_URL
+from crawler import crawl_esilv, LazyBrowser
 from leads_manager import get_leads_dataframe, clear_leads
 
+# Application-wide logging (a no-op on reruns, once the root logger has a handler)
+logging.basicConfig(level=logging.INFO)
+
 # Fix for Windows asyncio loop with Playwright
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
+# --- Shared resources (kept alive across Streamlit reruns) ---
+@st.cache_resource
+def get_event_loop():
+    """Event loop running in a background thread, so async resources outlive a single rerun."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+def run_async(coro):
+    """Runs `coro` on the shared event loop and waits for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+def iter_async(agen):
+    """Iterates an async generator on the shared event loop from synchronous code."""
+    while True:
+        try:
+            yield run_async(agen.__anext__())
+        except StopAsyncIteration:
+            return
+
+@st.cache_resource
+def get_browser():
+    """Headless browser shared by every crawl, only started once a page needs JavaScript rendering."""
+    return LazyBrowser()
+
 st.set_page_config(page_title="ESILV Smart Assistant", page_icon="🎓")
 
 st.title("🎓 ESILV Smart Assistant")
@@ -43,13 +73,17 @@ with tab_user:
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
                 try:
-                    response = run_crew(prompt)
-                    st.markdown(response)
+                    # Tokens are rendered as they arrive; the full text is returned at the end
+                    response = st.write_stream(iter_async(run_crew_stream(prompt)))
                     # Add assistant response to history
                     st.session_state.messages.append({"role": "assistant", "content": response})
                 except Exception as e:
                     st.error(f"An error occurred: {e}")
-                    st.info("Make sure Ollama is running (`ollama serve`) and you have pulled the model (`ollama pull llama3.1:8b`). Also ensure `qwen3-embedding:0.6b` is pulled for embeddings.")
+                    st.info(
+                        f"Make sure both vLLM servers are running (see README) and reachable: "
+                        f"the Information Specialist's model at {LLM_BASE_URL}, "
+                        f"and the Salesman and Clerk's model at {LIGHT_LLM_BASE_URL}."
+                    )
 
 # --- ADMIN TAB (Knowledge Base & Crawler) ---
 with tab_admin:
@@ -77,6 +111,7 @@ with tab_admin:
                 documents = load_documents(file_paths)
                 chunks = split_documents(documents)
                 add_to_chroma(chunks)
+                clear_response_cache()
                 
                 st.success(f"Successfully processed {len(file_paths)} files!")
                 
@@ -99,13 +134,15 @@ with tab_admin:
                 # Run the async crawler
                 # Streamlit runs in a loop, so we need to be careful.
                 # crawl4ai uses Playwright which requires the main loop on Windows sometimes or Proactor.
+                # The cached browser is bound to the shared background loop, so it must run there.
                 
-                documents = asyncio.run(crawl_esilv(start_url, max_depth))
+                documents = run_async(crawl_esilv(start_url, max_depth, browser=get_browser()))
                 
                 if documents:
                     st.info(f"Crawled {len(documents)} pages. Processing...")
                     chunks = split_documents(documents)
                     add_to_chroma(chunks)
+                    clear_response_cache()
                     st.success(f"Successfully added content from {len(documents)} pages!")
                 else:
                     st.warning("No content found to crawl.")
@@ -119,6 +156,7 @@ with tab_admin:
     st.subheader("🛠️ Maintenance")
     if st.button("Clear Knowledge Base"):
         clear_database()
+        clear_response_cache()
         st.success("Database cleared!")
 
     st.divider()
@@ -1,103 +1,240 @@
 import asyncio
-from typing import List
+import hashlib
+import re
+from collections import Counter, deque
+from typing import List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin, urlparse
+
+import aiohttp
 from crawl4ai import AsyncWebCrawler
 from langchain_core.documents import Document
+from selectolax.lexbor import LexborHTMLParser
+
+# Maximum number of pages fetched concurrently within one BFS level
+MAX_CONCURRENT_PAGES = 8
+
+# Pages whose static HTML yields less text than this are assumed to be rendered by JavaScript
+MIN_STATIC_TEXT_LENGTH = 1024
+STATIC_FETCH_TIMEOUT = aiohttp.ClientTimeout(total=30)
+# aiohttp's default "Python/aiohttp" User-Agent is commonly answered with 403 or a challenge by bot protection
+STATIC_FETCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+}
+# Pages that don't exist: rendering them in the browser can't help
+MISSING_PAGE_STATUSES = frozenset([404, 410])
+
+# Pages whose SimHash fingerprints differ by at most this many bits are near-duplicates
+SIMHASH_MAX_DISTANCE = 3
+# Site-wide template regions: their links are followed, but their text is neither indexed nor fingerprinted
+TEMPLATE_SELECTORS = "nav, header, footer"
+
+# Keywords that indicate the content is relevant to programs/admissions
+RELEVANT_KEYWORDS = [
+    "admission", "program", "bachelor", "master", "curriculum", 
+    "syllabus", "tuition", "fees", "apply", "deadline", 
+    "engineering", "major", "course", "calendar", "scholarship",
+    "international", "exchange", "degree"
+]
+# Single alternation so a page is scanned once instead of once per keyword
+RELEVANT_KEYWORDS_RE = re.compile("|".join(map(re.escape, RELEVANT_KEYWORDS)), re.IGNORECASE)
 
-async def crawl_esilv(start_url: str, max_depth: int = 2) -> List[Document]:
+def is_content_relevant(text: str) -> bool:
+    """Checks if the text contains any of the relevant keywords."""
+    if not text:
+        return False
+    # Stops at the first keyword found.
+    # We could require several distinct matches (e.g., at least 2 unique keywords) for stricter filtering
+    return RELEVANT_KEYWORDS_RE.search(text) is not None
+
+def simhash(text: str) -> int:
+    """64-bit SimHash fingerprint of the words of `text`, weighted by their frequency."""
+    weights = [0] * 64
+    for word, count in Counter(text.lower().split()).items():
+        word_hash = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += count if word_hash >> bit & 1 else -count
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+def is_near_duplicate(fingerprint: int, fingerprints: List[int]) -> bool:
+    """Checks if `fingerprint` is within SIMHASH_MAX_DISTANCE bits of any of `fingerprints`."""
+    return any((fingerprint ^ other).bit_count() <= SIMHASH_MAX_DISTANCE for other in fingerprints)
+
+def parse_static_page(html: str, url: str) -> Tuple[str, str, List[str]]:
+    """
+    Extracts the main text (without the nav / header / footer template), the title
+    and the same-site links (including the template's) of a static HTML page.
+    """
+    tree = LexborHTMLParser(html)
+    for node in tree.css("script, style, noscript, svg"):
+        node.decompose()
+
+    title_node = tree.css_first("title")
+    title = title_node.text(strip=True) if title_node else "No Title"
+
+    domain = urlparse(url).netloc
+    links = []
+    for anchor in tree.css("a[href]"):
+        href = urldefrag(urljoin(url, anchor.attributes.get("href") or "")).url
+        if urlparse(href).netloc == domain:
+            links.append(href)
+
+    # Shared boilerplate would dominate the SimHash of every page and make distinct pages look alike
+    for node in tree.css(TEMPLATE_SELECTORS):
+        node.decompose()
+    body = tree.body or tree.root
+    text = body.text(separator="\n", strip=True) if body else ""
+    return text, title, links
+
+class LazyBrowser:
+    """Playwright-backed AsyncWebCrawler, started only when a page actually needs JavaScript rendering."""
+
+    def __init__(self):
+        self._crawler: Optional[AsyncWebCrawler] = None
+        self._lock = asyncio.Lock()
+
+    async def arun(self, url: str):
+        async with self._lock:
+            if self._crawler is None:
+                # Configure the crawler (you can add more options here if needed)
+                crawler = AsyncWebCrawler(verbose=True)
+                await crawler.start()
+                self._crawler = crawler
+        return await self._crawler.arun(url=url)
+
+    async def close(self):
+        if self._crawler is not None:
+            await self._crawler.close()
+            self._crawler = None
+
+async def crawl_esilv(start_url: str, max_depth: int = 2, browser: Optional[LazyBrowser] = None) -> List[Document]:
     """
     Crawls the ESILV website starting from `start_url` up to `max_depth`.
     Returns a list of LangChain Document objects, filtered for relevance.
+
+    Pages are fetched as static HTML first; pages with too little text (rendered by JavaScript)
+    and pages the static fetch could not get (blocked, rate-limited, errors) go through the headless browser.
+    A `browser` can be passed in to keep one headless browser across crawls (it is left open);
+    otherwise one is started on demand and closed at the end of this crawl.
     """
+    owns_browser = browser is None
+    if owns_browser:
+        browser = LazyBrowser()
+    try:
+        async with aiohttp.ClientSession(timeout=STATIC_FETCH_TIMEOUT, headers=STATIC_FETCH_HEADERS) as session:
+            return await _crawl(session, browser, start_url, max_depth)
+    finally:
+        if owns_browser:
+            await browser.close()
+
+async def _fetch_page(session: aiohttp.ClientSession, browser: LazyBrowser, url: str) -> Optional[Tuple[str, str, List[str], str]]:
+    """
+    Returns the (content, title, internal links, main text) of `url`, or None if it could not be fetched.
+    The main text leaves out the site template and is what near-duplicate detection compares.
+    """
+    # Fast path: plain HTTP + HTML parsing
+    try:
+        async with session.get(url) as response:
+            # Missing pages and non-HTML resources (PDFs, images...) have nothing for the browser to render
+            if response.status in MISSING_PAGE_STATUSES or "html" not in response.content_type:
+                print(f"⚠️ Skipping {url}: HTTP {response.status}, {response.content_type}")
+                return None
+            if response.status == 200:
+                text, title, links = parse_static_page(await response.text(), url)
+                if len(text) >= MIN_STATIC_TEXT_LENGTH:
+                    return text, title, links, text
+            else:
+                # e.g. 403 / 429 / 5xx from bot protection or rate limiting
+                print(f"Static fetch of {url} returned HTTP {response.status}, using the browser")
+    except (aiohttp.ClientError, asyncio.TimeoutError, UnicodeDecodeError) as e:
+        print(f"Static fetch failed for {url}, using the browser: {e}")
+
+    # Slow path: render the page in the headless browser (JavaScript, or blocked static fetch)
+    result = await browser.arun(url)
+    if not result.success:
+        return None
+    # crawl4ai groups result.links into "internal" / "external"
+    links = [link_data.get("href") for link_data in result.links.get("internal", [])]
+    main_text, _, _ = parse_static_page(result.html or "", url)
+    return result.markdown, result.metadata.get("title", "No Title"), links, main_text
+
+async def _crawl(session: aiohttp.ClientSession, browser: LazyBrowser, start_url: str, max_depth: int) -> List[Document]:
     documents = []
+
+    # For this simple implementation, we'll just crawl the start_url
+    # If deep crawling is needed, crawl4ai's implementation details 
+    # for recursive crawling would be used here.
+    # Since crawl4ai is primarily a single-page or list-of-urls crawler in basic usage,
+    # we might need to implement the recursion manually or use its features if available.
+    # However, for the initial request "Crawl ESILV Website", let's assume we might receive 
+    # a request to crawl a specific page or we can extend this to find links.
     
-    # Keywords that indicate the content is relevant to programs/admissions
-    RELEVANT_KEYWORDS = [
-        "admission", "program", "bachelor", "master", "curriculum", 
-        "syllabus", "tuition", "fees", "apply", "deadline", 
-        "engineering", "major", "course", "calendar", "scholarship",
-        "international", "exchange", "degree"
-    ]
+    # NOTE: crawl4ai's primary API is `arun` for a single URL.
+    # To support "max_depth", we would typically need to parse links and queue them.
+    # For this first iteration, let's implement a simplified version that 
+    # just crawls the provided URL. If the user wants true recursion, we can expand.
+    # BUT, the prompt said "scraps information from the ESILV website" and "Crawl4AI".
+    # Let's try to get the content of the main page first.
     
-    def is_content_relevant(text: str) -> bool:
-        """Checks if the text contains any of the relevant keywords."""
-        if not text:
-            return False
-        text_lower = text.lower()
-        # Check if at least one keyword is present
-        # We could increase this threshold (e.g., at least 2 unique keywords) for stricter filtering
-        match_count = sum(1 for keyword in RELEVANT_KEYWORDS if keyword in text_lower)
-        return match_count >= 1
-
-    # Configure the crawler (you can add more options here if needed)
-    async with AsyncWebCrawler(verbose=True) as crawler:
-        # For this simple implementation, we'll just crawl the start_url
-        # If deep crawling is needed, crawl4ai's implementation details 
-        # for recursive crawling would be used here.
-        # Since crawl4ai is primarily a single-page or list-of-urls crawler in basic usage,
-        # we might need to implement the recursion manually or use its features if available.
-        # However, for the initial request "Crawl ESILV Website", let's assume we might receive 
-        # a request to crawl a specific page or we can extend this to find links.
-        
-        # NOTE: crawl4ai's primary API is `arun` for a single URL.
-        # To support "max_depth", we would typically need to parse links and queue them.
-        # For this first iteration, let's implement a simplified version that 
-        # just crawls the provided URL. If the user wants true recursion, we can expand.
-        # BUT, the prompt said "scraps information from the ESILV website" and "Crawl4AI".
-        # Let's try to get the content of the main page first.
-        
-        # If we really want recursion, we need to extract links.
-        # crawl4ai results include links.
-        
-        visited = set()
-        queue = [(start_url, 0)]
+    # If we really want recursion, we need to extract links.
+    # crawl4ai results include links.
+    
+    # URLs already queued or crawled: each URL enters the O(1) deque at most once
+    seen = {start_url}
+    queue = deque([(start_url, 0)])
+    # SimHash fingerprints of the kept pages, to drop near-identical ones before they get embedded
+    seen_fingerprints = []
+    # Bound the number of pages fetched at the same time
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_PAGES)
+
+    async def fetch(url):
+        async with semaphore:
+            return await _fetch_page(session, browser, url)
+    
+    while queue:
+        # Pop the whole current BFS level so its pages can be fetched concurrently
+        current_depth = queue[0][1]
+        level_urls = []
+        while queue and queue[0][1] == current_depth:
+            current_url, _ = queue.popleft()
+            if current_depth > max_depth:
+                continue
+            level_urls.append(current_url)
+
+        pages = await asyncio.gather(*[fetch(url) for url in level_urls], return_exceptions=True)
         
-        while queue:
-            current_url, current_depth = queue.pop(0)
-            
-            if current_url in visited or current_depth > max_depth:
+        for current_url, page in zip(level_urls, pages):
+            if isinstance(page, Exception):
+                print(f"Error crawling {current_url}: {page}")
                 continue
+            if page is None:
+                continue
+
+            content, title, links, main_text = page
+            # Check if content is relevant
+            if not is_content_relevant(content):
+                print(f"⚠️ Skipping irrelevant page: {current_url}")
+            elif is_near_duplicate(fingerprint := simhash(main_text), seen_fingerprints):
+                print(f"⚠️ Skipping near-duplicate page: {current_url}")
+            else:
+                seen_fingerprints.append(fingerprint)
+                # Create a LangChain Document
+                doc = Document(
+                    page_content=content,
+                    metadata={
+                        "source": current_url,
+                        "title": title,
+                        "page": 1 # Placeholder for compatibility
+                    }
+                )
+                documents.append(doc)
+                print(f"✅ Keeping relevant page: {current_url}")
             
-            visited.add(current_url)
-            
-            try:
-                result = await crawler.arun(url=current_url)
-                
-                if result.success:
-                    # Check if content is relevant
-                    if is_content_relevant(result.markdown):
-                        # Create a LangChain Document
-                        doc = Document(
-                            page_content=result.markdown,
-                            metadata={
-                                "source": current_url,
-                                "title": result.metadata.get("title", "No Title"),
-                                "page": 1 # Placeholder for compatibility
-                            }
-                        )
-                        documents.append(doc)
-                        print(f"✅ Keeping relevant page: {current_url}")
-                    else:
-                        print(f"⚠️ Skipping irrelevant page: {current_url}")
-                    
-                    # If we haven't reached max depth, add links to queue
-                    if current_depth < max_depth:
-                        # Extract internal links (heuristic: starts with start_url domain)
-                        # result.links is a dictionary usually? Or list of dicts?
-                        # Let's check the result structure dynamically or assume standard crawl4ai output
-                        # Based on standard usage, result.links might be available.
-                        # If not, we might rely on the user to provide specific URLs or 
-                        # just stick to depth 0 for safety in V1.
-                        
-                        # Let's stick to just the requested URL for now to ensure stability 
-                        # unless we are sure about the link structure.
-                        # However, to be "better", let's try to find internal links if available.
-                        links = result.links.get("internal", [])
-                        for link_data in links:
-                            href = link_data.get("href")
-                            if href and href not in visited:
-                                queue.append((href, current_depth + 1))
-                                
-            except Exception as e:
-                print(f"Error crawling {current_url}: {e}")
-                
+            # If we haven't reached max depth, add links of the next level to the queue
+            if current_depth < max_depth:
+                for href in links:
+                    if href and href not in seen:
+                        seen.add(href)
+                        queue.append((href, current_depth + 1))
+
     return documents
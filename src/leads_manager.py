@@ -1,36 +1,73 @@
-import json
 import os
 import logging
 import threading
 from datetime import datetime, timezone
 from typing import List, Dict, Optional
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+import orjson
+
+# Logging is configured by the application entrypoint (app.py)
 logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
 
-LEADS_FILE = os.path.join("data", "leads.json")
+# One JSON object per line (NDJSON): saving a lead appends a line instead of rewriting the file
+LEADS_FILE = os.path.join("data", "leads.ndjson")
+# Former single JSON array file, converted on first access
+LEGACY_LEADS_FILE = os.path.join("data", "leads.json")
 file_lock = threading.Lock()
 
 def ensure_data_dir():
     """Ensure the data directory exists."""
     os.makedirs(os.path.dirname(LEADS_FILE), exist_ok=True)
 
+def write_file_atomic(path: str, data: bytes):
+    """Replace `path` with `data` via a synced temporary file, so a crash never leaves it half-written."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def migrate_legacy_leads():
+    """Convert the former JSON array file to NDJSON if no NDJSON file exists yet."""
+    # Under the lock, so a concurrent save_lead can't append to a file the migration then replaces
+    with file_lock:
+        if os.path.exists(LEADS_FILE) or not os.path.exists(LEGACY_LEADS_FILE):
+            return
+        
+        try:
+            with open(LEGACY_LEADS_FILE, "rb") as f:
+                leads = orjson.loads(f.read())
+            write_file_atomic(LEADS_FILE, b"".join(orjson.dumps(lead) + b"\n" for lead in leads))
+            os.remove(LEGACY_LEADS_FILE)
+            logger.info("Migrated %d leads from %s to %s.", len(leads), LEGACY_LEADS_FILE, LEADS_FILE)
+        except (orjson.JSONDecodeError, OSError) as e:
+            logger.error("Error migrating %s: %s", LEGACY_LEADS_FILE, e, exc_info=True)
+
 def load_leads() -> List[Dict]:
-    """Load leads from the JSON file."""
+    """Load leads from the NDJSON file."""
+    migrate_legacy_leads()
     if not os.path.exists(LEADS_FILE):
         return []
     
-    try:
-        with open(LEADS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        logger.error(f"Error decoding JSON from {LEADS_FILE}. Returning empty list.")
-        return []
+    with open(LEADS_FILE, "rb") as f:
+        lines = f.read().splitlines()
+
+    leads = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            leads.append(orjson.loads(line))
+        except orjson.JSONDecodeError:
+            # e.g. a line cut short by a crash during save_lead: only that lead is lost
+            logger.warning("Skipping malformed line %d in %s.", line_number, LEADS_FILE)
+    return leads
 
 def save_lead(name: str, email: str, topic: Optional[str] = None) -> str:
     """
-    Save a new lead to the JSON file.
+    Save a new lead by appending it to the NDJSON file.
     
     Args:
         name: Name of the interested user.
@@ -40,28 +77,32 @@ def save_lead(name: str, email: str, topic: Optional[str] = None) -> str:
     Returns:
         Status message.
     """
-    logger.info(f"Attempting to save lead: name='{name}', email='{email}', topic='{topic}'")
+    logger.info("Attempting to save lead: name=%r, email=%r, topic=%r", name, email, topic)
     ensure_data_dir()
+    migrate_legacy_leads()
     
     with file_lock:
-        leads = load_leads()
-        
         new_lead = {
             "name": name,
             "email": email,
             "topic": topic or "General Inquiry",
-            "timestamp": datetime.now(timezone.utc).isoformat()
+            # orjson writes datetimes as RFC 3339 strings, the same format as isoformat()
+            "timestamp": datetime.now(timezone.utc)
         }
         
-        leads.append(new_lead)
-        
         try:
-            with open(LEADS_FILE, "w", encoding="utf-8") as f:
-                json.dump(leads, f, indent=4, ensure_ascii=False)
+            with open(LEADS_FILE, "a+b") as f:
+                record = orjson.dumps(new_lead) + b"\n"
+                # Start a fresh line if the last save was cut short, so only that record is malformed
+                if f.seek(0, os.SEEK_END) > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        record = b"\n" + record
+                f.write(record)
             logger.info("Lead saved successfully.")
             return "Lead saved successfully."
         except Exception as e:
-            logger.error(f"Error saving lead to file: {str(e)}", exc_info=True)
+            logger.error("Error saving lead to file: %s", e, exc_info=True)
             return f"Error saving lead: {str(e)}"
 
 def get_leads_dataframe():
@@ -100,11 +141,9 @@ def clear_leads() -> bool:
     
     with file_lock:
         try:
-            # Overwrite with empty list
-            with open(LEADS_FILE, "w", encoding="utf-8") as f:
-                json.dump([], f, indent=4, ensure_ascii=False)
+            write_file_atomic(LEADS_FILE, b"")
             logger.info("All leads cleared successfully.")
             return True
         except Exception as e:
-            logger.error(f"Error clearing leads: {str(e)}", exc_info=True)
+            logger.error("Error clearing leads: %s", e, exc_info=True)
             return False
@@ -0,0 +1,20 @@
+from typing import List
+
+import fitz  # PyMuPDF
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+
+def load_pdf(path: str) -> List[Document]:
+    """
+    Loads one PDF file as one Document per page, using PyMuPDF's C parser.
+    Files without any extractable text (e.g. scanned) go through PyPDFLoader instead.
+    """
+    with fitz.open(path) as pdf:
+        documents = [
+            Document(page_content=page.get_text("text"), metadata={"source": path, "page": i})
+            for i, page in enumerate(pdf)
+        ]
+
+    if not any(doc.page_content.strip() for doc in documents):
+        return PyPDFLoader(path).load()
+    return documents
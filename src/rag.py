@@ -1,30 +1,140 @@
+import functools
+import glob
+import hashlib
+import json
 import os
 import shutil
+import threading
 import time
 import concurrent.futures
+from collections import deque
+from itertools import groupby
 from typing import List
 
-from langchain_community.document_loaders import PyPDFLoader
+import diskcache
+from chromadb.api.client import SharedSystemClient
+import numpy as np
+import torch
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 
+from pdf_loader import load_pdf
+from semantic_cache import SemanticCache
+
 # Configuration
 CHROMA_PATH = "data/chroma_db"
 DATA_PATH = "data/raw"
+EMBEDDING_MODEL = "nomic-ai/nomic-embed-text-v1"
+# Document embeddings keyed by model + chunk text, kept across ingests and database resets
+EMBEDDING_CACHE_PATH = "data/emb_cache"
+EMBEDDING_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# Texts per model forward pass when embedding documents
+EMBEDDING_BATCH_SIZE = 64
+
+# Chroma insert batch size: CHROMA_BATCH_SIZE overrides the value measured by _tune_batch_size
+BATCH_SIZE_CANDIDATES = [32, 64, 128, 256, 512, 1024]
+DEFAULT_BATCH_SIZE = 256
+TUNING_FILE = os.path.join(CHROMA_PATH, ".tuning.json")
+# IDs per db.get call when checking which chunks are already stored
+ID_LOOKUP_BATCH_SIZE = 5000
+# Chunks per embed_documents call: the write of one group overlaps the embedding of the next,
+# so groups stay small enough for typical ingests to span several of them (8 forward passes each)
+EMBEDDING_GROUP_SIZE = 512
+# Embedded groups waiting for (or being written to) Chroma before embedding pauses
+MAX_PENDING_WRITE_GROUPS = 2
+
+# Embeddings are unit-length (normalize_embeddings=True), so inner product ranks like cosine
+# without the extra normalization per comparison.
+# construction_ef is lowered from the default 200 for cheaper bulk inserts, search_ef raised from 10 for recall.
+# Only applies when the collection is created.
+COLLECTION_METADATA = {
+    "hnsw:space": "ip",
+    "hnsw:construction_ef": 100,
+    "hnsw:M": 16,
+    "hnsw:search_ef": 64,
+}
+
+# Chroma client shared by queries and ingestion, opened on first use (see _get_db)
+_DB = None
+_DB_LOCK = threading.Lock()
+# Retrieved contexts of previous queries, reused for paraphrased queries
+_context_cache = SemanticCache(threshold=0.95, max_entries=512)
 
+@functools.lru_cache(maxsize=1)
 def get_embedding_function():
-    return HuggingFaceEmbeddings(model_name="nomic-ai/nomic-embed-text-v1", model_kwargs={"trust_remote_code": True})
+    model_kwargs = {"trust_remote_code": True, "device": EMBEDDING_DEVICE}
+    if EMBEDDING_DEVICE == "cuda":
+        # Half-precision weights and activations on GPU; vectors are still stored as float32 by Chroma
+        model_kwargs["model_kwargs"] = {"torch_dtype": torch.float16}
+    return HuggingFaceEmbeddings(
+        model_name=EMBEDDING_MODEL,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE, "normalize_embeddings": True},
+    )
+
+@functools.lru_cache(maxsize=2048)
+def _embed_query_cached(query_text: str):
+    return tuple(get_embedding_function().embed_query(query_text))
+
+def embed_query(query_text: str) -> List[float]:
+    """
+    Embeds a query, memoized on its whitespace-normalized text.
+    """
+    return list(_embed_query_cached(" ".join(query_text.split())))
+
+@functools.lru_cache(maxsize=1)
+def _get_embedding_cache():
+    return diskcache.Cache(EMBEDDING_CACHE_PATH)
+
+def _embedding_cache_key(text: str) -> str:
+    return hashlib.blake2b((EMBEDDING_MODEL + text).encode("utf-8"), digest_size=16).hexdigest()
+
+def embed_documents(texts: List[str]) -> List[List[float]]:
+    """
+    Embeds document texts, only running the model on texts not already in the embedding cache.
+    """
+    cache = _get_embedding_cache()
+    keys = [_embedding_cache_key(text) for text in texts]
+    embeddings = [cache.get(key) for key in keys]
+    misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if len(misses) < len(texts):
+        print(f"   ♻️ Embedding cache hits: {len(texts) - len(misses)}/{len(texts)}")
+
+    if misses:
+        new_embeddings = get_embedding_function().embed_documents([texts[i] for i in misses])
+        with cache.transact():
+            for i, embedding in zip(misses, new_embeddings):
+                cache.set(keys[i], np.asarray(embedding, dtype=np.float32).tobytes())
+        for i, embedding in zip(misses, new_embeddings):
+            embeddings[i] = embedding
+
+    return [
+        np.frombuffer(embedding, dtype=np.float32).tolist() if isinstance(embedding, bytes) else embedding
+        for embedding in embeddings
+    ]
+
+def _get_db():
+    """
+    Returns the shared Chroma client, opening it on first use.
+    """
+    global _DB
+    with _DB_LOCK:
+        if _DB is None:
+            _delete_trash()
+            _DB = Chroma(
+                persist_directory=CHROMA_PATH,
+                embedding_function=get_embedding_function(),
+                collection_metadata=COLLECTION_METADATA,
+            )
+        return _DB
 
 def load_documents(files):
     """
     Loads PDF documents from the file paths.
     """
-    documents = []
-    for file in files:
-        loader = PyPDFLoader(file)
-        documents.extend(loader.load())
-    return documents
+    # Sequential on purpose: PyMuPDF parses a page in a few ms, less than the startup cost of worker processes
+    return [doc for file in files for doc in load_pdf(file)]
 
 def split_documents(documents):
     """
@@ -45,10 +155,7 @@ def add_to_chroma(chunks: List):
     
     # Measure DB Init
     t0 = time.time()
-    db = Chroma(
-        persist_directory=CHROMA_PATH, 
-        embedding_function=get_embedding_function()
-    )
+    db = _get_db()
     print(f"⏱️ DB Init: {time.time() - t0:.4f}s")
 
     # Measure ID calculation
@@ -58,14 +165,18 @@ def add_to_chroma(chunks: List):
 
     # Measure Fetching existing IDs
     t0 = time.time()
-    # 1. Fetch existing IDs in one go (Optimized)
-    existing_items = db.get(ids=[c.metadata["id"] for c in chunks_with_ids], include=[])
-    existing_ids = set(existing_items["ids"])
+    # 1. Fetch existing IDs for these chunks only, in fixed-size sub-batches queried in parallel
+    chunk_ids = [c.metadata["id"] for c in chunks_with_ids]
+    id_batches = [chunk_ids[i : i + ID_LOOKUP_BATCH_SIZE] for i in range(0, len(chunk_ids), ID_LOOKUP_BATCH_SIZE)]
+    existing_ids = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        for existing_items in executor.map(lambda ids: db.get(ids=ids, include=[]), id_batches):
+            existing_ids.update(existing_items["ids"])
     print(f"⏱️ Fetch Existing IDs: {time.time() - t0:.4f}s")
     
     # Measure Filtering
     t0 = time.time()
-    new_chunks = [c for c in chunks_with_ids if c.metadata["id"] not in existing_ids]
+    new_chunks = [c for c, chunk_id in zip(chunks_with_ids, chunk_ids) if chunk_id not in existing_ids]
     print(f"⏱️ Filtering New Chunks: {time.time() - t0:.4f}s")
 
     if not new_chunks:
@@ -74,60 +185,154 @@ def add_to_chroma(chunks: List):
 
     print(f"👉 Adding {len(new_chunks)} new documents...")
 
-    # 2. Use single-threaded, large batch ingestion
-    BATCH_SIZE = 1024
-    embedding_function = get_embedding_function()
-    
-    # Process in batches
-    for i in range(0, len(new_chunks), BATCH_SIZE):
-        batch_start_time = time.time()
-        batch = new_chunks[i : i + BATCH_SIZE]
-        
-        # 3. Precompute embeddings ONCE
-        embed_start_time = time.time()
-        embeddings = embedding_function.embed_documents(
-            [chunk.page_content for chunk in batch]
-        )
-        print(f"   ⏱️ Batch {i//BATCH_SIZE + 1} Embedding Generation: {time.time() - embed_start_time:.4f}s")
-        
-        add_start_time = time.time()
-        db._collection.add(
-            documents=[c.page_content for c in batch],
-            metadatas=[c.metadata for c in batch],
-            ids=[c.metadata["id"] for c in batch],
-            embeddings=embeddings
-        )
-        print(f"   ⏱️ Batch {i//BATCH_SIZE + 1} Add to DB: {time.time() - add_start_time:.4f}s")
-        
-        print(f"   Processed batch {i//BATCH_SIZE + 1}/{(len(new_chunks)-1)//BATCH_SIZE + 1} ({len(batch)} docs) in {time.time() - batch_start_time:.4f}s")
+    # Split the Document list into parallel lists once; every later step works on slices of them
+    texts, metadatas, ids = _split_chunks(new_chunks)
+
+    # 2. Use single-threaded batch ingestion, with a batch size measured once per database
+    BATCH_SIZE = _load_batch_size()
+    if BATCH_SIZE is None:
+        tuning_sample_size = sum(BATCH_SIZE_CANDIDATES)
+        if len(texts) >= tuning_sample_size:
+            # The tuning inserts are real inserts: only the rest is left to add
+            BATCH_SIZE = _tune_batch_size(
+                db, texts[:tuning_sample_size], metadatas[:tuning_sample_size], ids[:tuning_sample_size]
+            )
+            texts = texts[tuning_sample_size:]
+            metadatas = metadatas[tuning_sample_size:]
+            ids = ids[tuning_sample_size:]
+        else:
+            BATCH_SIZE = DEFAULT_BATCH_SIZE
+    print(f"   Batch size: {BATCH_SIZE}")
+
+    # 3. Embed in groups of EMBEDDING_GROUP_SIZE chunks.
+    # DB writes run on a dedicated thread, overlapping with the embedding of the next group.
+    # At most MAX_PENDING_WRITE_GROUPS groups are in flight, which bounds the embeddings held in memory.
+    pending_writes = deque()
+    batch_number = 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as db_writer:
+        for i in range(0, len(texts), EMBEDDING_GROUP_SIZE):
+            group_end = min(i + EMBEDDING_GROUP_SIZE, len(texts))
+
+            if len(pending_writes) >= MAX_PENDING_WRITE_GROUPS:
+                # Also surfaces any write error
+                pending_writes.popleft().result()
+
+            embed_start_time = time.time()
+            embeddings = embed_documents(texts[i:group_end])
+            print(f"   ⏱️ Embedding Generation ({group_end - i} docs): {time.time() - embed_start_time:.4f}s")
+
+            pending_writes.append(db_writer.submit(
+                _add_group, db, texts[i:group_end], metadatas[i:group_end], ids[i:group_end], embeddings,
+                BATCH_SIZE, batch_number
+            ))
+            batch_number += -(-(group_end - i) // BATCH_SIZE)
+
+        while pending_writes:
+            pending_writes.popleft().result()
 
+    # New documents can change what a query retrieves
+    _context_cache.clear()
     print(f"✅ Finished in {time.time() - total_start_time:.2f}s")
 
-def calculate_chunk_ids(chunks):
+def _split_chunks(chunks: List):
     """
-    Create chunk IDs like "data/monopoly.pdf:6:2"
-    Page Source : Page Number : Chunk Index
+    Returns the texts, metadatas and IDs of `chunks` as three parallel lists.
     """
-    last_page_id = None
-    current_chunk_index = 0
+    return (
+        [c.page_content for c in chunks],
+        [c.metadata for c in chunks],
+        [c.metadata["id"] for c in chunks],
+    )
 
-    for chunk in chunks:
-        source = chunk.metadata.get("source")
-        page = chunk.metadata.get("page")
-        current_page_id = f"{source}:{page}"
+def _add_group(db, texts: List[str], metadatas: List[dict], ids: List[str], embeddings: List,
+               batch_size: int, first_batch_number: int):
+    """
+    Writes one embedded group to Chroma in batches of `batch_size`.
+    """
+    for batch_number, j in enumerate(range(0, len(ids), batch_size), start=first_batch_number):
+        k = j + batch_size
+        _add_batch(db, texts[j:k], metadatas[j:k], ids[j:k], embeddings[j:k], batch_number)
 
-        # If the page ID is the same as the last one, increment the index.
-        if current_page_id == last_page_id:
-            current_chunk_index += 1
-        else:
-            current_chunk_index = 0
+def _add_batch(db, texts: List[str], metadatas: List[dict], ids: List[str], embeddings: List, batch_number: int):
+    add_start_time = time.time()
+    db._collection.add(
+        documents=texts,
+        metadatas=metadatas,
+        ids=ids,
+        embeddings=embeddings
+    )
+    print(f"   ⏱️ Batch {batch_number} Add to DB ({len(ids)} docs): {time.time() - add_start_time:.4f}s")
+
+def _load_batch_size():
+    """
+    Returns the Chroma insert batch size from CHROMA_BATCH_SIZE or TUNING_FILE, or None if not tuned yet.
+    Values that are not positive integers are ignored.
+    """
+    env_batch_size = os.environ.get("CHROMA_BATCH_SIZE")
+    if env_batch_size:
+        batch_size = _positive_int(env_batch_size)
+        if batch_size is not None:
+            return batch_size
+        print(f"⚠️ Ignoring invalid CHROMA_BATCH_SIZE={env_batch_size!r}")
+    if not os.path.exists(TUNING_FILE):
+        return None
+    try:
+        with open(TUNING_FILE, "r", encoding="utf-8") as f:
+            return _positive_int(json.load(f)["batch_size"])
+    except (OSError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return None
+
+def _positive_int(value):
+    """Returns `value` as an int if it is one >= 1 (e.g. "256"), else None."""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number >= 1 else None
+
+def _tune_batch_size(db, texts: List[str], metadatas: List[dict], ids: List[str]) -> int:
+    """
+    Inserts the sample chunks in consecutive batches of each candidate size, timing the Chroma writes,
+    and records the size with the lowest time per chunk in TUNING_FILE.
+    """
+    t0 = time.time()
+    embeddings = embed_documents(texts)
+    print(f"   ⏱️ Tuning Sample Embedding Generation: {time.time() - t0:.4f}s")
 
-        # Calculate the chunk ID.
-        chunk_id = f"{current_page_id}:{current_chunk_index}"
-        last_page_id = current_page_id
+    seconds_per_chunk = {}
+    start = 0
+    for size in BATCH_SIZE_CANDIDATES:
+        end = start + size
+        t0 = time.time()
+        db._collection.add(
+            documents=texts[start:end],
+            metadatas=metadatas[start:end],
+            ids=ids[start:end],
+            embeddings=embeddings[start:end]
+        )
+        seconds_per_chunk[size] = (time.time() - t0) / size
+        print(f"   ⏱️ Tuning Batch Size {size}: {seconds_per_chunk[size] * 1000:.3f}ms per chunk")
+        start += size
 
-        # Add it to the page meta-data.
-        chunk.metadata["id"] = chunk_id
+    best_size = min(seconds_per_chunk, key=seconds_per_chunk.get)
+    with open(TUNING_FILE, "w", encoding="utf-8") as f:
+        json.dump({"batch_size": best_size, "seconds_per_chunk": seconds_per_chunk}, f, indent=4)
+    return best_size
+
+def calculate_chunk_ids(chunks):
+    """
+    Create chunk IDs like "data/monopoly.pdf:6:2"
+    Page Source : Page Number : Chunk Index
+    """
+    # Chunks arrive in document + page order: each run of chunks from the same page is numbered from 0.
+    page_keys = [(chunk.metadata.get("source"), chunk.metadata.get("page")) for chunk in chunks]
+    position = 0
+    for (source, page), run in groupby(page_keys):
+        run_length = sum(1 for _ in run)
+        for chunk_index, chunk in enumerate(chunks[position : position + run_length]):
+            # Add it to the page meta-data.
+            chunk.metadata["id"] = f"{source}:{page}:{chunk_index}"
+        position += run_length
 
     return chunks
 
@@ -135,16 +340,42 @@ def query_rag(query_text: str):
     """
     Query the RAG system and return the most relevant context.
     """
-    # Prepare the DB.
-    embedding_function = get_embedding_function()
-    db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embedding_function)
+    query_embedding = embed_query(query_text)
+    cached_context = _context_cache.lookup(query_embedding)
+    if cached_context is not None:
+        return cached_context
 
     # Search the DB.
-    results = db.similarity_search_with_score(query_text, k=5)
+    results = _get_db().similarity_search_by_vector_with_relevance_scores(query_embedding, k=5)
 
     context_text = "\n\n---\n\n".join([doc.page_content for doc, _score in results])
+    _context_cache.add(query_embedding, context_text)
     return context_text
 
 def clear_database():
-    if os.path.exists(CHROMA_PATH):
-        shutil.rmtree(CHROMA_PATH)
+    """
+    Empties the vector store. The database directory is renamed away and deleted in the background,
+    so the call returns without waiting on the size of the index files.
+    """
+    global _DB
+    with _DB_LOCK:
+        _DB = None
+        # Chroma reuses one system (and its SQLite connection) per path: drop it so the next client starts fresh
+        SharedSystemClient.clear_system_cache()
+        if os.path.exists(CHROMA_PATH):
+            os.rename(CHROMA_PATH, f"{CHROMA_PATH}.trash.{time.time_ns()}")
+        _delete_trash()
+    _context_cache.clear()
+
+def _delete_trash():
+    """
+    Deletes the renamed database directories in a background thread, including those
+    left behind when a previous process exited before its delete finished.
+    """
+    trash_paths = glob.glob(f"{CHROMA_PATH}.trash.*")
+    if trash_paths:
+        threading.Thread(target=_rmtree_all, args=(trash_paths,), daemon=True).start()
+
+def _rmtree_all(paths: List[str]):
+    for path in paths:
+        shutil.rmtree(path, ignore_errors=True)
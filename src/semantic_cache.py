@@ -0,0 +1,78 @@
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+# Number of set bits for every byte value, used to popcount XOR-ed binary codes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+class SemanticCache:
+    """
+    In-memory cache keyed by query embedding.
+    A lookup hits when the cosine similarity between the query and a cached entry exceeds `threshold`.
+
+    Entries are screened with 1-bit (sign) codes compared by Hamming distance;
+    only the `rescore_k` closest candidates are rescored against their float16 vectors.
+    When `max_entries` is set, the oldest entries are evicted first (FIFO).
+    """
+
+    def __init__(self, threshold: float = 0.95, rescore_k: int = 8, max_entries: Optional[int] = None):
+        self.threshold = threshold
+        self.rescore_k = rescore_k
+        self.max_entries = max_entries
+        self._codes: Optional[np.ndarray] = None  # (N, ceil(d / 8)) uint8, packed sign bits
+        self._vectors: Optional[np.ndarray] = None  # (N, d) float16, L2-normalized rows
+        self._values: List[str] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) + 1e-12)
+
+    @staticmethod
+    def _binarize(vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(vectors > 0, axis=-1)
+
+    def lookup(self, vector) -> Optional[str]:
+        """Returns the cached value closest to `vector`, or None if nothing is similar enough."""
+        query = self._normalize(vector)
+        query_code = self._binarize(query)
+        with self._lock:
+            if self._codes is None:
+                return None
+            hamming = _POPCOUNT[self._codes ^ query_code].sum(axis=1)
+            if len(hamming) > self.rescore_k:
+                candidates = np.argpartition(hamming, self.rescore_k)[: self.rescore_k]
+            else:
+                candidates = np.arange(len(hamming))
+            scores = self._vectors[candidates].astype(np.float32) @ query
+            best = int(scores.argmax())
+            if scores[best] > self.threshold:
+                return self._values[candidates[best]]
+        return None
+
+    def add(self, vector, value: str):
+        """Stores `value` under the embedding `vector`."""
+        row = self._normalize(vector)[np.newaxis, :]
+        code = self._binarize(row)
+        with self._lock:
+            if self._codes is None:
+                self._codes = code
+                self._vectors = row.astype(np.float16)
+            else:
+                # Keep at most max_entries rows, dropping the oldest ones
+                evicted = 0 if self.max_entries is None else max(len(self._values) + 1 - self.max_entries, 0)
+                self._codes = np.vstack([self._codes[evicted:], code])
+                self._vectors = np.vstack([self._vectors[evicted:], row.astype(np.float16)])
+                self._values = self._values[evicted:]
+            self._values.append(value)
+
+    def clear(self):
+        with self._lock:
+            self._codes = None
+            self._vectors = None
+            self._values = []
+
+    def __len__(self):
+        return len(self._values)
@@ -0,0 +1,141 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+
+import crawler
+
+def make_template(word_count=1500, seed=0):
+    """Nav and footer text of a site template: a small vocabulary repeated across the page, as menus are."""
+    rng = random.Random(seed)
+    words = [rng.choice(["admissions", "programs", "campus", "contact", "news", "research"]) + str(rng.randrange(20))
+             for _ in range(word_count)]
+    half = word_count // 2
+    return " ".join(words[:half]), " ".join(words[half:])
+
+def make_page(body, template, links=()):
+    nav, footer = template
+    anchors = "".join(f'<a href="{href}">link</a>' for href in links)
+    return (
+        f"<html><head><title>ESILV</title></head><body>"
+        f"<header><nav>{anchors}{nav}</nav></header>"
+        f"<main><p>{body}</p></main>"
+        f"<footer>{footer}</footer></body></html>"
+    )
+
+def body_words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+def crawl_pages(monkeypatch, pages, start_url):
+    """Runs _crawl over in-memory HTML pages, keyed by URL."""
+    async def fake_fetch(session, browser, url):
+        if url not in pages:
+            return None
+        text, title, links = crawler.parse_static_page(pages[url], url)
+        return text, title, links, text
+
+    monkeypatch.setattr(crawler, "_fetch_page", fake_fetch)
+    return asyncio.run(crawler._crawl(None, None, start_url, max_depth=1))
+
+def test_parse_static_page_drops_template_text_but_keeps_its_links():
+    html = make_page("Tuition fees for the engineering program", ("menu words", "footer words"),
+                     links=["/en/admissions", "https://other.example/x"])
+    text, title, links = crawler.parse_static_page(html, "https://www.esilv.fr/en/")
+    assert text == "Tuition fees for the engineering program"
+    assert title == "ESILV"
+    assert links == ["https://www.esilv.fr/en/admissions"]
+
+def test_pages_sharing_a_template_with_different_bodies_are_all_kept(monkeypatch):
+    template = make_template()
+    pages = {"https://www.esilv.fr/en/": make_page(
+        "Engineering program overview " + body_words("overview", 120), template,
+        links=["/en/tuition", "/en/exchange"],
+    )}
+    pages["https://www.esilv.fr/en/tuition"] = make_page("Tuition fees " + body_words("fees", 50), template)
+    pages["https://www.esilv.fr/en/exchange"] = make_page("International exchange " + body_words("exchange", 80), template)
+
+    documents = crawl_pages(monkeypatch, pages, "https://www.esilv.fr/en/")
+    assert sorted(doc.metadata["source"] for doc in documents) == sorted(pages)
+
+def test_same_body_under_another_url_is_dropped(monkeypatch):
+    template = make_template()
+    body = "Admission deadlines " + body_words("deadline", 100)
+    pages = {
+        "https://www.esilv.fr/en/": make_page(body, template, links=["/en/copy"]),
+        "https://www.esilv.fr/en/copy": make_page(body, make_template(seed=1)),
+    }
+
+    documents = crawl_pages(monkeypatch, pages, "https://www.esilv.fr/en/")
+    assert [doc.metadata["source"] for doc in documents] == ["https://www.esilv.fr/en/"]
+
+class FakeResponse:
+    def __init__(self, status, content_type, body=""):
+        self.status = status
+        self.content_type = content_type
+        self._body = body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def text(self):
+        return self._body
+
+class FakeSession:
+    """Answers every GET with `outcome`: a FakeResponse, or an exception to raise."""
+
+    def __init__(self, outcome):
+        self._outcome = outcome
+
+    def get(self, url):
+        if isinstance(self._outcome, Exception):
+            raise self._outcome
+        return self._outcome
+
+class FakeBrowser:
+    def __init__(self):
+        self.urls = []
+
+    async def arun(self, url):
+        self.urls.append(url)
+        html = "<html><body><p>Rendered admission page</p></body></html>"
+        return SimpleNamespace(success=True, markdown="Rendered admission page", html=html,
+                               metadata={"title": "Rendered"}, links={"internal": []})
+
+LONG_PAGE = make_page("Engineering program " + body_words("program", 300), ("menu", "footer"))
+
+@pytest.mark.parametrize("outcome", [
+    FakeResponse(403, "text/html", "<html><body>Access denied</body></html>"),
+    FakeResponse(429, "text/html"),
+    FakeResponse(503, "text/html"),
+    FakeResponse(200, "text/html", "<html><body><div id='app'></div></body></html>"),
+    aiohttp.ClientConnectionError("connection reset"),
+    asyncio.TimeoutError(),
+])
+def test_fetch_page_falls_back_to_the_browser(outcome):
+    browser = FakeBrowser()
+    page = asyncio.run(crawler._fetch_page(FakeSession(outcome), browser, "https://www.esilv.fr/en/"))
+    assert browser.urls == ["https://www.esilv.fr/en/"]
+    assert page[0] == "Rendered admission page"
+    assert page[3] == "Rendered admission page"
+
+@pytest.mark.parametrize("outcome", [
+    FakeResponse(200, "application/pdf"),
+    FakeResponse(200, "image/png"),
+    FakeResponse(404, "text/html"),
+])
+def test_fetch_page_skips_missing_and_non_html_resources(outcome):
+    browser = FakeBrowser()
+    assert asyncio.run(crawler._fetch_page(FakeSession(outcome), browser, "https://www.esilv.fr/x")) is None
+    assert browser.urls == []
+
+def test_fetch_page_keeps_static_pages_out_of_the_browser():
+    browser = FakeBrowser()
+    page = asyncio.run(crawler._fetch_page(FakeSession(FakeResponse(200, "text/html", LONG_PAGE)), browser,
+                                           "https://www.esilv.fr/en/"))
+    assert browser.urls == []
+    assert page[0].startswith("Engineering program")
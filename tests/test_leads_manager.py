@@ -0,0 +1,54 @@
+import os
+
+import orjson
+import pytest
+
+import leads_manager
+
+@pytest.fixture
+def leads_paths(tmp_path, monkeypatch):
+    leads_file = tmp_path / "data" / "leads.ndjson"
+    legacy_file = tmp_path / "data" / "leads.json"
+    monkeypatch.setattr(leads_manager, "LEADS_FILE", str(leads_file))
+    monkeypatch.setattr(leads_manager, "LEGACY_LEADS_FILE", str(legacy_file))
+    return leads_file, legacy_file
+
+def names(leads):
+    return [lead["name"] for lead in leads]
+
+def test_legacy_file_is_migrated_then_appended_to(leads_paths):
+    leads_file, legacy_file = leads_paths
+    legacy_file.parent.mkdir(parents=True)
+    legacy_file.write_bytes(orjson.dumps([
+        {"name": "Alice", "email": "alice@example.org", "topic": "Fees", "timestamp": "2024-01-01T00:00:00+00:00"},
+    ]))
+
+    assert leads_manager.save_lead("Bob", "bob@example.org", "Admissions") == "Lead saved successfully."
+
+    assert not legacy_file.exists()
+    assert names(leads_manager.load_leads()) == ["Alice", "Bob"]
+    assert len(leads_file.read_bytes().splitlines()) == 2
+    assert not os.path.exists(str(leads_file) + ".tmp")
+
+def test_save_after_truncated_line_keeps_earlier_and_new_lead(leads_paths):
+    leads_file, _ = leads_paths
+    leads_manager.save_lead("Alice", "alice@example.org")
+    # A save cut short by a crash: partial record, no trailing newline
+    with open(leads_file, "ab") as f:
+        f.write(b'{"name": "Tor')
+
+    leads_manager.save_lead("Bob", "bob@example.org")
+
+    leads = leads_manager.load_leads()
+    assert names(leads) == ["Alice", "Bob"]
+    assert leads[1]["topic"] == "General Inquiry"
+
+def test_clear_leads_leaves_an_empty_file(leads_paths):
+    leads_file, _ = leads_paths
+    leads_manager.save_lead("Alice", "alice@example.org")
+
+    assert leads_manager.clear_leads() is True
+
+    assert leads_file.exists()
+    assert leads_file.read_bytes() == b""
+    assert leads_manager.load_leads() == []
@@ -0,0 +1,96 @@
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+import rag
+
+class FakeCollection:
+    def __init__(self):
+        self.rows = {}
+
+    def add(self, documents, metadatas, ids, embeddings):
+        assert len(documents) == len(metadatas) == len(ids) == len(embeddings)
+        self.rows.update(zip(ids, documents))
+
+class FakeDB:
+    """Stands in for the Chroma client: only what add_to_chroma uses."""
+
+    def __init__(self):
+        self._collection = FakeCollection()
+
+    def get(self, ids, include):
+        return {"ids": [i for i in ids if i in self._collection.rows]}
+
+@pytest.fixture
+def fake_db(tmp_path, monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(rag, "_get_db", lambda: db)
+    monkeypatch.setattr(rag, "embed_documents", lambda texts: [[1.0, 0.0] for _ in texts])
+    monkeypatch.setattr(rag, "TUNING_FILE", str(tmp_path / ".tuning.json"))
+    monkeypatch.delenv("CHROMA_BATCH_SIZE", raising=False)
+    return db
+
+def make_chunks(count):
+    return [Document(page_content=f"chunk {i}", metadata={"source": "doc.pdf", "page": i}) for i in range(count)]
+
+TUNING_SAMPLE_SIZE = sum(rag.BATCH_SIZE_CANDIDATES)
+
+@pytest.mark.parametrize("count", [TUNING_SAMPLE_SIZE - 1, TUNING_SAMPLE_SIZE, TUNING_SAMPLE_SIZE + 1])
+def test_add_to_chroma_around_tuning_sample_size(fake_db, count):
+    rag.add_to_chroma(make_chunks(count))
+    assert len(fake_db._collection.rows) == count
+
+def test_add_to_chroma_skips_stored_chunks(fake_db):
+    rag.add_to_chroma(make_chunks(10))
+    rag.add_to_chroma(make_chunks(25))
+    assert len(fake_db._collection.rows) == 25
+
+def test_clear_database_deletes_current_and_leftover_trash(tmp_path, monkeypatch):
+    chroma_path = tmp_path / "chroma_db"
+    monkeypatch.setattr(rag, "CHROMA_PATH", str(chroma_path))
+    (chroma_path / "index").mkdir(parents=True)
+    # Left behind by a process that exited before its background delete finished
+    (tmp_path / "chroma_db.trash.1").mkdir()
+
+    rag.clear_database()
+
+    deadline = time.time() + 5
+    while list(tmp_path.iterdir()) and time.time() < deadline:
+        time.sleep(0.01)
+    assert list(tmp_path.iterdir()) == []
+
+@pytest.fixture
+def tuning_file(tmp_path, monkeypatch):
+    path = tmp_path / ".tuning.json"
+    monkeypatch.setattr(rag, "TUNING_FILE", str(path))
+    monkeypatch.delenv("CHROMA_BATCH_SIZE", raising=False)
+    return path
+
+@pytest.mark.parametrize("value", ["0", "-3", "abc", "1.5"])
+def test_invalid_env_batch_size_falls_back_to_tuning(tuning_file, monkeypatch, value):
+    monkeypatch.setenv("CHROMA_BATCH_SIZE", value)
+    assert rag._load_batch_size() is None
+    tuning_file.write_text('{"batch_size": 128}')
+    assert rag._load_batch_size() == 128
+
+@pytest.mark.parametrize("contents", ["[256]", '{"batch_size": null}', '{"batch_size": 0}',
+                                      '{"batch_size": "abc"}', '{"size": 256}', "not json"])
+def test_malformed_tuning_file_is_ignored(tuning_file, contents):
+    tuning_file.write_text(contents)
+    assert rag._load_batch_size() is None
+
+def test_valid_batch_size_sources(tuning_file, monkeypatch):
+    tuning_file.write_text('{"batch_size": 128}')
+    assert rag._load_batch_size() == 128
+    monkeypatch.setenv("CHROMA_BATCH_SIZE", "64")
+    assert rag._load_batch_size() == 64
+
+def test_add_to_chroma_retunes_over_malformed_tuning_file(fake_db, monkeypatch):
+    with open(rag.TUNING_FILE, "w", encoding="utf-8") as f:
+        f.write('{"batch_size": null}')
+    monkeypatch.setenv("CHROMA_BATCH_SIZE", "0")
+    rag.add_to_chroma(make_chunks(TUNING_SAMPLE_SIZE + 10))
+    assert len(fake_db._collection.rows) == TUNING_SAMPLE_SIZE + 10
+    monkeypatch.delenv("CHROMA_BATCH_SIZE")
+    assert rag._load_batch_size() in rag.BATCH_SIZE_CANDIDATES
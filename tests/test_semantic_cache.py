@@ -0,0 +1,78 @@
+import numpy as np
+
+from semantic_cache import SemanticCache
+
+DIM = 768
+
+def random_vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+def perturbed(vector, scale=0.01, seed=1):
+    noise = np.random.default_rng(seed).standard_normal(vector.shape).astype(np.float32)
+    return vector + scale * np.linalg.norm(vector) / np.sqrt(len(vector)) * noise
+
+def with_cosine(vector, cosine, seed=2):
+    """A vector whose cosine similarity with `vector` is `cosine`."""
+    unit = vector / np.linalg.norm(vector)
+    other = np.random.default_rng(seed).standard_normal(vector.shape).astype(np.float32)
+    other -= (other @ unit) * unit
+    other /= np.linalg.norm(other)
+    return cosine * unit + np.sqrt(1 - cosine ** 2) * other
+
+def test_lookup_on_empty_cache_misses():
+    assert SemanticCache().lookup(random_vectors(1)[0]) is None
+
+def test_lookup_hits_on_same_and_slightly_perturbed_vector():
+    vector = random_vectors(1)[0]
+    cache = SemanticCache(threshold=0.95)
+    cache.add(vector, "answer")
+    assert cache.lookup(vector) == "answer"
+    assert cache.lookup(perturbed(vector)) == "answer"
+    # Scale does not matter: vectors are compared by cosine similarity
+    assert cache.lookup(3 * vector) == "answer"
+
+def test_lookup_misses_below_threshold():
+    vector = random_vectors(1)[0]
+    cache = SemanticCache(threshold=0.95)
+    cache.add(vector, "answer")
+    assert cache.lookup(with_cosine(vector, 0.9)) is None
+    assert cache.lookup(with_cosine(vector, 0.97)) == "answer"
+    assert cache.lookup(random_vectors(1, seed=5)[0]) is None
+
+def test_oldest_entry_is_evicted_at_max_entries():
+    a, b, c = random_vectors(3)
+    cache = SemanticCache(max_entries=2)
+    cache.add(a, "a")
+    cache.add(b, "b")
+    cache.add(c, "c")
+    assert len(cache) == 2
+    assert cache.lookup(a) is None
+    assert cache.lookup(b) == "b"
+    assert cache.lookup(c) == "c"
+
+def test_max_entries_of_one_keeps_only_the_latest_entry():
+    a, b = random_vectors(2)
+    cache = SemanticCache(max_entries=1)
+    cache.add(a, "a")
+    cache.add(b, "b")
+    assert len(cache) == 1
+    assert cache.lookup(a) is None
+    assert cache.lookup(b) == "b"
+
+def test_hit_is_found_among_more_than_rescore_k_entries():
+    vectors = random_vectors(50)
+    cache = SemanticCache(rescore_k=8)
+    for i, vector in enumerate(vectors):
+        cache.add(vector, f"answer {i}")
+    for i in (0, 37, 49):
+        assert cache.lookup(perturbed(vectors[i], seed=i)) == f"answer {i}"
+
+def test_clear_drops_every_entry():
+    vector = random_vectors(1)[0]
+    cache = SemanticCache()
+    cache.add(vector, "answer")
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.lookup(vector) is None
+    cache.add(vector, "new answer")
+    assert cache.lookup(vector) == "new answer"